@@ -6,7 +6,7 @@ FortiAppSec Traffic Logs – Unified Flask backend
 
 This file merges:
 1) Legacy features:
-   - Pull NDJSON from Azure Blob Storage → pandas DataFrame cache
+   - Pull NDJSON from Azure Blob Storage → Arrow table cache
    - /data (JSON), /data.csv, /data.json, /reload
    - Counters (total, last load)
 2) New configuration layer:
@@ -26,15 +26,22 @@ Python logging:
 
 from __future__ import annotations
 
+import asyncio
+import gzip
+import hashlib
 import os
-import io
 import json
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import orjson
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
 from flask import Flask, jsonify, render_template, request, Response, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 
 # Optional deps are imported lazily inside functions:
 #   pandas
@@ -51,9 +58,44 @@ app = Flask(
 )
 
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, so jsonify()/get_json() skip stdlib json."""
+    sort_keys = False
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default).decode("utf-8")
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
 PY_DEBUG = False  # True = DEBUG logs; False = INFO logs
 app.logger.setLevel("DEBUG" if PY_DEBUG else "INFO")
 
+# gzip the big JSON/CSV payloads; log tables compress 5-20x thanks to
+# repeated host/country/agent strings. Small bodies are not worth it.
+GZIP_MIMETYPES = {"application/json", "text/csv"}
+GZIP_MIN_BYTES = 1024
+
+@app.after_request
+def compress_response(resp: Response) -> Response:
+    if (
+        resp.status_code != 200
+        or resp.direct_passthrough
+        or resp.mimetype not in GZIP_MIMETYPES
+        or resp.headers.get("Content-Encoding")
+        or "gzip" not in (request.headers.get("Accept-Encoding") or "").lower()
+    ):
+        return resp
+    body = resp.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return resp
+    resp.set_data(gzip.compress(body, compresslevel=5))
+    resp.headers["Content-Encoding"] = "gzip"
+    resp.headers.add("Vary", "Accept-Encoding")
+    return resp
+
 BASE_DIR = Path(__file__).resolve().parent
 ENV_PATH   = BASE_DIR / ".env"
 CFG_PATH   = BASE_DIR / "config.json"
@@ -71,6 +113,7 @@ DEFAULT_CONFIG: Dict[str, Any] = {
     "start_utc": "",
     "end_utc": "",
     "max_blobs": 5000,              # 0 = unlimited
+    "cache_ttl_seconds": 900,       # reuse OUTPUT_DIR/cache.parquet on boot if fresher; 0 = disabled
     # legacy/optional:
     "OUTPUT_DIR": "./out",
     "PORT": 8000,
@@ -136,6 +179,7 @@ def ensure_default_from_env_once() -> None:
             "start_utc": env.get("START_UTC", ""),
             "end_utc": env.get("END_UTC", ""),
             "max_blobs": int(env.get("MAX_BLOBS", "0") or "0"),
+            "cache_ttl_seconds": int(env.get("CACHE_TTL_SECONDS", "900") or "900"),
             "OUTPUT_DIR": env.get("OUTPUT_DIR", "./out"),
             "PORT": int(env.get("PORT", "8000")),
         }
@@ -145,12 +189,55 @@ def ensure_default_from_env_once() -> None:
 
 ensure_default_from_env_once()
 
-# ======================
-# LEGACY INGEST (pandas)
-# ======================
-DF_CACHE = None          # pandas.DataFrame or None
+# =====================
+# LEGACY INGEST (Arrow)
+# =====================
+TABLE_CACHE = None       # pyarrow.Table or None
 LAST_LOAD_UTC: Optional[datetime] = None
 
+# Derived per-reload state (recomputed by _rebuild_derived_cache):
+# column order, the projected/ISO-rendered view, the pre-serialized
+# bodies, the window-filter timestamps and the ETag. The cache is
+# immutable between reloads, so these are computed once instead of per
+# request. They are bundled into one immutable object published with a
+# single reference assignment: under the gthread server a request takes
+# its own `d = DERIVED` and never sees a half-updated mix of two reload
+# generations.
+class _Derived:
+    __slots__ = ("cols", "view", "json_bytes", "csv_bytes", "win_ts", "etag")
+
+    def __init__(self, cols=None, view=None, json_bytes=None,
+                 csv_bytes=None, win_ts=None, etag=None):
+        self.cols: List[str] = cols or []
+        self.view = view                 # pyarrow.Table projection of TABLE_CACHE
+        self.json_bytes: Optional[bytes] = json_bytes
+        self.csv_bytes: Optional[bytes] = csv_bytes
+        self.win_ts = win_ts             # pandas datetime64[ns, UTC] Series
+        self.etag: Optional[str] = etag
+
+DERIVED = _Derived()     # empty until the first load
+
+# preferred first, then the rest (legacy behavior)
+PREFERRED_COLS = [
+    "http_host", "status", "srccountry", "user_name", "http_agent",
+    "_blob_last_modified", "_blob_name"
+]
+
+# NDJSON lines are handed to the Arrow reader in batches of this size,
+# so parse memory stays bounded on very large blobs.
+PARSE_BATCH_LINES = 100_000
+
+# Serializes cache (re)builds: with a threaded WSGI server, concurrent
+# first requests must not both kick off a full Azure download.
+LOAD_LOCK = threading.Lock()
+
+# Bounded-cardinality log fields with massive value repetition: stored
+# dictionary-encoded so each distinct string exists once in memory and
+# Parquet snapshots get dictionary pages.
+DICT_ENCODED_COLS = (
+    "http_host", "status", "srccountry", "user_name", "http_agent", "_blob_name",
+)
+
 def _load_pandas():
     try:
         import pandas as pd
@@ -167,13 +254,286 @@ def _load_azure_sdk():
         app.logger.error("azure-storage-blob import failed: %s", e)
         raise
 
+def _load_azure_aio_sdk():
+    """Async Azure SDK (needs aiohttp). Returns None when unavailable, in
+    which case ingest falls back to the thread-pool path."""
+    try:
+        from azure.storage.blob.aio import BlobServiceClient
+        return BlobServiceClient
+    except Exception as e:
+        app.logger.info("azure-storage-blob aio unavailable (%s); using thread pool", e)
+        return None
+
+def _load_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.json     # noqa: F401  -- registers the pa.json submodule
+        import pyarrow.csv      # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return pa
+    except Exception as e:
+        app.logger.error("pyarrow import failed: %s", e)
+        raise
+
 def _account_url(account: str) -> str:
     return f"https://{account}.blob.core.windows.net"
 
-def load_logs_from_blob(cfg: Dict[str, Any]):
-    """Download blobs, parse NDJSON, return merged pandas DataFrame."""
+def _concat_tables_safe(pa, tables):
+    """concat_tables with permissive promotion that survives type conflicts.
+
+    Each batch/blob infers its schema from the rows it saw, so the same
+    field can come back int64 in one table and string in another, which
+    makes plain concat_tables raise. Conflicting fields are cast to
+    string (per-value str() when Arrow cannot cast) and the concat is
+    retried.
+    """
+    if len(tables) == 1:
+        return tables[0]
+    try:
+        return pa.concat_tables(tables, promote_options="permissive")
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        pass
+
+    types: Dict[str, set] = {}
+    for t in tables:
+        for f in t.schema:
+            if not pa.types.is_null(f.type):
+                types.setdefault(f.name, set()).add(f.type)
+    conflicted = {name for name, seen in types.items() if len(seen) > 1}
+
+    fixed = []
+    for t in tables:
+        for name in conflicted:
+            if name not in t.column_names:
+                continue
+            i = t.schema.get_field_index(name)
+            col = t.column(i)
+            if pa.types.is_string(col.type) or pa.types.is_null(col.type):
+                continue
+            try:
+                col = col.cast(pa.string())
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                col = pa.array(
+                    [x if isinstance(x, str) or x is None else str(x) for x in col.to_pylist()]
+                )
+            t = t.set_column(i, name, col)
+        fixed.append(t)
+    return pa.concat_tables(fixed, promote_options="permissive")
+
+class _NdjsonAccumulator:
+    """Incremental NDJSON parser: feed() byte chunks, finish() an Arrow table.
+
+    Keeps the partial trailing line between chunks and hands complete lines
+    to Arrow's multithreaded C++ reader in PARSE_BATCH_LINES batches, so a
+    blob is never materialized as one big bytes object and parsing overlaps
+    the network reads.
+    """
+
+    def __init__(self, pa):
+        self.pa = pa
+        self._carry = b""
+        self._pending: List[bytes] = []
+        self._tables: List[Any] = []
+
+    def feed(self, chunk: bytes) -> None:
+        lines = (self._carry + chunk).split(b"\n")
+        self._carry = lines.pop()
+        for line in lines:
+            self._push_line(line)
+
+    def finish(self):
+        """Flush remaining input and return the parsed table, or None."""
+        self._push_line(self._carry)
+        self._carry = b""
+        self._flush()
+        if not self._tables:
+            return None
+        return _concat_tables_safe(self.pa, self._tables)
+
+    def _push_line(self, line: bytes) -> None:
+        line = line.strip()
+        if not line:
+            return
+        if line.endswith(b","):
+            line = line[:-1]
+        self._pending.append(line)
+        if len(self._pending) >= PARSE_BATCH_LINES:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        tbl = self._parse_batch(self._pending)
+        if tbl is not None:
+            self._tables.append(tbl)
+        self._pending = []
+
+    def _parse_batch(self, lines: List[bytes]):
+        pa = self.pa
+        payload = b"\n".join(lines)
+        try:
+            return pa.json.read_json(pa.BufferReader(payload))
+        except pa.ArrowInvalid:
+            # A malformed line poisons the whole batch for the Arrow reader;
+            # fall back to per-line orjson and skip the bad records. Values
+            # go straight into per-column lists (SoA) so the table is built
+            # columnar instead of through a list of row dicts.
+            cols: Dict[str, List[Any]] = {}
+            n = 0
+            for line in lines:
+                try:
+                    rec = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+                n += 1
+                for k, v in rec.items():
+                    col = cols.get(k)
+                    if col is None:
+                        # new key: pad the rows seen before it
+                        col = cols[k] = [None] * (n - 1)
+                    col.append(v)
+                for col in cols.values():
+                    if len(col) < n:
+                        col.append(None)
+            if n == 0:
+                return None
+            arrays = {}
+            for k, v in cols.items():
+                try:
+                    arrays[k] = pa.array(v)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    # The field mixes JSON types across lines (e.g. 200 then
+                    # "err"); coerce to string like the old object-dtype
+                    # column did instead of failing the whole batch.
+                    arrays[k] = pa.array(
+                        [x if isinstance(x, str) or x is None else str(x) for x in v]
+                    )
+            return pa.table(arrays)
+
+def _blob_table(pa, table, blob):
+    """Attach the provenance columns to one blob's parsed table."""
+    if table is None:
+        return None
+    last_modified = (
+        blob.last_modified.astimezone(timezone.utc).isoformat()
+        if getattr(blob, "last_modified", None) else None
+    )
+    # Constant columns via pa.repeat: no per-row Python list, no boxing.
+    n = table.num_rows
+    table = table.append_column("_blob_name", pa.repeat(blob.name, n))
+    table = table.append_column(
+        "_blob_last_modified",
+        pa.repeat(last_modified, n) if last_modified is not None else pa.nulls(n, pa.string()),
+    )
+    return table
+
+def _dictionary_encode(pa, table):
+    """Dictionary-encode the known high-repetition string columns."""
+    pc = pa.compute
+    for name in DICT_ENCODED_COLS:
+        if name not in table.column_names:
+            continue
+        i = table.schema.get_field_index(name)
+        col = table.column(i)
+        if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+            table = table.set_column(i, name, pc.dictionary_encode(col))
+    return table
+
+def _select_blobs(blobs: List[Any], max_blobs: int,
+                  seen: Optional[Dict[str, datetime]]) -> List[Any]:
+    app.logger.info("Found %d blobs", len(blobs))
+    if seen is not None:
+        # Keep blobs the cache has never seen plus blobs modified since
+        # their ingest (the exporter appends to the current blob, so its
+        # last_modified keeps moving).
+        def _changed(b):
+            lm = getattr(b, "last_modified", None)
+            prev = seen.get(b.name)
+            return lm is not None and (prev is None or lm > prev)
+        blobs = [b for b in blobs if _changed(b)]
+        app.logger.info("Incremental load: %d new or modified blobs", len(blobs))
+    if max_blobs > 0:
+        blobs = blobs[:max_blobs]
+        app.logger.info("Limiting to %d blobs due to max_blobs", len(blobs))
+    return blobs
+
+# In-flight cap for the asyncio ingest path.
+AIO_MAX_INFLIGHT = 64
+
+async def _fetch_all_async(pa, BlobServiceClient, account_url: str, key: str,
+                           container: str, max_blobs: int,
+                           seen: Optional[Dict[str, datetime]]):
+    """Overlapped ingest on a single thread via the aio Azure SDK."""
+    async with BlobServiceClient(account_url=account_url, credential=key) as bsc:
+        cc = bsc.get_container_client(container)
+        blobs = _select_blobs([b async for b in cc.list_blobs()], max_blobs, seen)
+        sem = asyncio.Semaphore(AIO_MAX_INFLIGHT)
+
+        async def fetch_and_parse(blob):
+            async with sem:
+                acc = _NdjsonAccumulator(pa)
+                downloader = await cc.download_blob(blob.name, max_concurrency=4)
+                async for chunk in downloader.chunks():
+                    acc.feed(chunk)
+                return _blob_table(pa, acc.finish(), blob)
+
+        results = await asyncio.gather(*(fetch_and_parse(b) for b in blobs))
+    return [t for t in results if t is not None]
+
+def _fetch_all_threaded(pa, BlobServiceClient, account_url: str, key: str,
+                        container: str, max_blobs: int,
+                        seen: Optional[Dict[str, datetime]]):
+    """Thread-pool ingest fallback (sync Azure SDK)."""
+    bsc = BlobServiceClient(account_url=account_url, credential=key)
+    cc  = bsc.get_container_client(container)
+    blobs = _select_blobs(list(cc.list_blobs()), max_blobs, seen)
+
+    def fetch_and_parse(blob):
+        acc = _NdjsonAccumulator(pa)
+        downloader = cc.download_blob(blob.name, max_concurrency=4)
+        for chunk in downloader.chunks():
+            acc.feed(chunk)
+        return _blob_table(pa, acc.finish(), blob)
+
+    # Blob fetches are I/O-bound: overlap them on a thread pool instead of
+    # paying one RTT per blob on a single connection. Parsing happens inside
+    # the worker so only ready-made Arrow tables are merged here.
+    tables = []
+    max_workers = min(32, (os.cpu_count() or 4) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(fetch_and_parse, blob) for blob in blobs]
+        for fut in as_completed(futures):
+            tbl = fut.result()
+            if tbl is not None:
+                tables.append(tbl)
+    return tables
+
+def _snapshot_export(table, out_dir: Path, tag: str) -> None:
+    """Write the timestamped Parquet snapshot (runs on a background thread).
+
+    The CSV snapshot was dropped: it cost roughly an order of magnitude
+    more to write and the current CSV is always available from /data.csv.
+    """
+    try:
+        pa = _load_pyarrow()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        pa.parquet.write_table(
+            table, str(out_dir / f"traffic_logs_{tag}.parquet"),
+            compression="zstd", use_dictionary=True,
+        )
+    except Exception:
+        app.logger.exception("snapshot export failed")
+
+def load_logs_from_blob(cfg: Dict[str, Any],
+                        seen: Optional[Dict[str, datetime]] = None):
+    """Download blobs, parse NDJSON, return merged pyarrow.Table.
+
+    With `seen` (blob name -> last_modified at ingest), only blobs that
+    are new or modified since their ingest are fetched (incremental
+    reload on top of an existing cache).
+    """
     pd = _load_pandas()
-    BlobServiceClient = _load_azure_sdk()
+    pa = _load_pyarrow()
 
     account   = cfg.get("AZURE_STORAGE_ACCOUNT")
     key       = cfg.get("AZURE_STORAGE_KEY")
@@ -186,73 +546,202 @@ def load_logs_from_blob(cfg: Dict[str, Any]):
     account_url = _account_url(account)
     app.logger.info("Loading blobs: account=%s container=%s", account, container)
 
-    bsc = BlobServiceClient(account_url=account_url, credential=key)
-    cc  = bsc.get_container_client(container)
-
-    rows: List[Dict[str, Any]] = []
-    blobs = list(cc.list_blobs())
-    app.logger.info("Found %d blobs", len(blobs))
-
-    if max_blobs > 0:
-        blobs = blobs[:max_blobs]
-        app.logger.info("Limiting to %d blobs due to max_blobs", len(blobs))
-
-    for blob in blobs:
-        data = cc.download_blob(blob.name).readall()
-        with io.StringIO(data.decode("utf-8", errors="ignore")) as fh:
-            for line in fh:
-                line = line.strip()
-                if not line:
-                    continue
-                if line.endswith(","):
-                    line = line[:-1]
-                try:
-                    rec = json.loads(line)
-                except Exception:
-                    continue
-                rec["_blob_name"] = blob.name
-                rec["_blob_last_modified"] = (
-                    blob.last_modified.astimezone(timezone.utc).isoformat()
-                    if getattr(blob, "last_modified", None) else None
-                )
-                rows.append(rec)
-
-    df = pd.DataFrame(rows)
-    app.logger.info("Merged rows: %d", len(df))
-
-    # Best-effort sort by a common time field if present
-    if not df.empty:
+    # Prefer the asyncio SDK: hundreds of in-flight requests on one thread,
+    # no per-blob thread cost. Thread pool remains as fallback.
+    AioBlobServiceClient = _load_azure_aio_sdk()
+    if AioBlobServiceClient is not None:
+        tables = asyncio.run(_fetch_all_async(
+            pa, AioBlobServiceClient, account_url, key, container, max_blobs, seen))
+    else:
+        tables = _fetch_all_threaded(
+            pa, _load_azure_sdk(), account_url, key, container, max_blobs, seen)
+
+    if tables:
+        # _concat_tables_safe unifies the per-blob schemas (blobs may carry
+        # different field sets, or disagree on a field's inferred type).
+        merged = _concat_tables_safe(pa, tables)
+        merged = _dictionary_encode(pa, merged)
+    else:
+        merged = pa.table({})
+    app.logger.info("Merged rows: %d", merged.num_rows)
+
+    if merged.num_rows:
+        # Best-effort sort by a common time field if present
         for c in ("ts", "timestamp", "@timestamp", "time", "event_time"):
-            if c in df.columns:
+            if c in merged.column_names:
                 try:
-                    df["_sort_ts"] = pd.to_datetime(df[c], errors="coerce", utc=True)
-                    df = df.sort_values("_sort_ts", na_position="last")
+                    sort_ts = pd.to_datetime(merged.column(c).to_pandas(), errors="coerce", utc=True)
+                    merged = merged.append_column("_sort_ts", pa.Array.from_pandas(sort_ts))
+                    merged = merged.sort_by([("_sort_ts", "ascending")])
                     break
                 except Exception:
                     pass
 
-        # Optional snapshot export to ./out
+        # The snapshot is not needed to serve responses: hand it to a daemon
+        # thread so ensure_loaded()//reload return without waiting on disk I/O.
+        # Arrow tables are immutable, so sharing `merged` is safe.
         out_dir = Path(cfg.get("OUTPUT_DIR") or "./out")
-        out_dir.mkdir(parents=True, exist_ok=True)
         tag = datetime.now().strftime("%Y%m%d-%H%M%S")
-        df.to_csv(out_dir / f"traffic_logs_{tag}.csv", index=False)
-        try:
-            df.to_parquet(out_dir / f"traffic_logs_{tag}.parquet", index=False)
-        except Exception:
-            pass
+        threading.Thread(target=_snapshot_export, args=(merged, out_dir, tag), daemon=True).start()
+
+    return merged
+
+def _csv_safe(pa, table):
+    """Render nested (struct/list) columns as JSON strings.
+
+    Arrow's JSON reader produces struct columns for nested objects, which
+    pyarrow.csv.write_csv rejects; the old pandas to_csv stringified them,
+    so keep that behavior for the CSV bodies.
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_nested(field.type):
+            col = pa.array([
+                None if x is None else orjson.dumps(x).decode("utf-8")
+                for x in table.column(i).to_pylist()
+            ])
+            table = table.set_column(i, field.name, col)
+    return table
+
+def _rebuild_derived_cache() -> None:
+    """Recompute the per-reload derived state from TABLE_CACHE.
+
+    Everything is built into a fresh _Derived first; the final assignment
+    to DERIVED is the only visible state change, so concurrent requests
+    read either the old generation or the new one, never a mix.
+    """
+    global DERIVED
+    if TABLE_CACHE is None or TABLE_CACHE.num_rows == 0:
+        DERIVED = _Derived()
+        return
+    pa = _load_pyarrow()
+    pref_present = [c for c in PREFERRED_COLS if c in TABLE_CACHE.column_names]
+    cols = pref_present + [c for c in TABLE_CACHE.column_names if c not in pref_present]
+    view = _isoify_timestamps(TABLE_CACHE.select(cols), pa)
+    json_bytes = orjson.dumps(view.to_pylist())
+    try:
+        # Write from the ISO-rendered view so CSV timestamps carry the
+        # same explicit UTC marker as the JSON bodies.
+        buf = pa.BufferOutputStream()
+        pa.csv.write_csv(_csv_safe(pa, view), buf)
+        csv_bytes = buf.getvalue().to_pybytes()
+    except Exception:
+        # Never let the CSV rendering break ensure_loaded()/reload;
+        # /data.csv degrades to an empty body instead.
+        app.logger.exception("CSV pre-serialization failed")
+        csv_bytes = None
+    win_ts = _window_timestamps(TABLE_CACHE)
+    # LAST_LOAD_UTC participates so a reload always refreshes the tag even
+    # when the data happens to be byte-identical.
+    stamp = LAST_LOAD_UTC.isoformat().encode() if LAST_LOAD_UTC else b""
+    etag = hashlib.blake2b(json_bytes + stamp, digest_size=16).hexdigest()
+    DERIVED = _Derived(cols, view, json_bytes, csv_bytes, win_ts, etag)
+
+def _cache_parquet_path(cfg: Dict[str, Any]) -> Path:
+    return Path(cfg.get("OUTPUT_DIR") or "./out") / "cache.parquet"
+
+def _persist_cache(cfg: Dict[str, Any]) -> None:
+    """Write TABLE_CACHE to OUTPUT_DIR/cache.parquet so restarts can skip Azure."""
+    if TABLE_CACHE is None or TABLE_CACHE.num_rows == 0:
+        return
+    try:
+        pa = _load_pyarrow()
+        path = _cache_parquet_path(cfg)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pa.parquet.write_table(TABLE_CACHE, str(path), compression="zstd", row_group_size=64 * 1024)
+    except Exception:
+        app.logger.exception("could not persist cache.parquet")
 
-    return df
+def _drop_persisted_cache() -> None:
+    try:
+        _cache_parquet_path(read_config()).unlink(missing_ok=True)
+    except Exception:
+        app.logger.warning("could not remove cache.parquet")
+
+def _load_persisted_cache(cfg: Dict[str, Any]):
+    """Return (table, mtime_utc) from a fresh cache.parquet, or None."""
+    try:
+        ttl = int(cfg.get("cache_ttl_seconds") or 0)
+    except Exception:
+        ttl = 0
+    path = _cache_parquet_path(cfg)
+    if ttl <= 0 or not path.exists():
+        return None
+    mtime = datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
+    if (datetime.now(timezone.utc) - mtime).total_seconds() > ttl:
+        return None
+    try:
+        pa = _load_pyarrow()
+        return pa.parquet.read_table(str(path)), mtime
+    except Exception:
+        app.logger.exception("could not read cache.parquet; falling back to Azure")
+        return None
+
+def _cache_blob_watermarks() -> Dict[str, datetime]:
+    """Per-blob last_modified recorded in the cache, keyed by blob name.
+
+    A single global watermark is not enough: the exporter appends to the
+    current blob, so its last_modified keeps moving and the blob must be
+    refetched (and its cached rows replaced) rather than treated as
+    already ingested.
+    """
+    out: Dict[str, datetime] = {}
+    if TABLE_CACHE is None or not {"_blob_name", "_blob_last_modified"} <= set(TABLE_CACHE.column_names):
+        return out
+    try:
+        pa = _load_pyarrow()
+        pairs = pa.table({
+            "_blob_name": TABLE_CACHE.column("_blob_name").cast(pa.string()),
+            "_blob_last_modified": TABLE_CACHE.column("_blob_last_modified").cast(pa.string()),
+        })
+        agg = pairs.group_by("_blob_name").aggregate([("_blob_last_modified", "max")])
+        for name, iso in zip(agg.column("_blob_name").to_pylist(),
+                             agg.column("_blob_last_modified_max").to_pylist()):
+            if name and iso:
+                out[name] = datetime.fromisoformat(iso)
+    except Exception:
+        app.logger.exception("could not compute per-blob watermarks")
+        return {}
+    return out
 
 def ensure_loaded():
-    global DF_CACHE, LAST_LOAD_UTC
-    if DF_CACHE is None:
+    global TABLE_CACHE, LAST_LOAD_UTC
+    if TABLE_CACHE is not None:
+        return
+    with LOAD_LOCK:
+        if TABLE_CACHE is not None:  # another request loaded while we waited
+            return
         cfg = read_config()
+
+        # Warm start from the persisted snapshot when it is fresh enough.
+        cached = _load_persisted_cache(cfg)
+        if cached is not None:
+            TABLE_CACHE, LAST_LOAD_UTC = cached
+            _rebuild_derived_cache()
+            app.logger.info("Loaded %d rows from cache.parquet (age within TTL)", TABLE_CACHE.num_rows)
+            return
+
         if not (cfg.get("AZURE_STORAGE_ACCOUNT") and cfg.get("AZURE_STORAGE_KEY") and cfg.get("AZURE_CONTAINER")):
             app.logger.warning("Config incomplete; skipping initial load")
             return
-        DF_CACHE = load_logs_from_blob(cfg)
+        TABLE_CACHE = load_logs_from_blob(cfg)
         LAST_LOAD_UTC = datetime.now(timezone.utc)
-        app.logger.info("Initial load complete: rows=%d", 0 if DF_CACHE is None else len(DF_CACHE))
+        _rebuild_derived_cache()
+        _persist_cache(cfg)
+        app.logger.info("Initial load complete: rows=%d", 0 if TABLE_CACHE is None else TABLE_CACHE.num_rows)
+
+def _isoify_timestamps(table, pa):
+    """Render timestamp columns as ISO-8601 strings (vectorized Arrow strftime).
+
+    Tz-naive columns come from Arrow's JSON reader parsing the source
+    "...Z" strings, i.e. they are known-UTC: render them with an explicit
+    Z suffix so exports keep the UTC marker the source logs carried.
+    """
+    pc = pa.compute
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type):
+            fmt = "%Y-%m-%dT%H:%M:%S%z" if field.type.tz else "%Y-%m-%dT%H:%M:%SZ"
+            table = table.set_column(i, field.name, pc.strftime(table.column(i), format=fmt))
+    return table
 
 # ==================
 # Time/range helpers
@@ -268,29 +757,26 @@ def parse_custom_utc(ts: str | None) -> Optional[datetime]:
         app.logger.warning("parse_custom_utc: invalid %r", ts)
         return None
 
-def record_in_window(rec: Dict[str, Any], start: Optional[datetime], end: Optional[datetime]) -> bool:
-    if not (start or end):
-        return True
-    ts = rec.get("log_timestamp") or rec.get("_blob_last_modified")
-    if ts is None:
-        return True
-    try:
-        num = float(ts)
-        ms  = num if num > 1e12 else num * 1000.0
-        t   = datetime.fromtimestamp(ms/1000.0, tz=timezone.utc)
-    except Exception:
-        # try ISO
-        try:
-            t = datetime.fromisoformat(str(ts)).astimezone(timezone.utc)
-        except Exception:
-            return True
-    if start and t < start:
-        return False
-    if end and t > end:
-        return False
-    return True
-
-def apply_window_and_limit_records(records: List[Dict[str, Any]], cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _window_timestamps(table):
+    """Per-row UTC timestamps used for window filtering, parsed once at reload.
+
+    Same semantics as the old per-record parsing: log_timestamp (epoch
+    seconds or milliseconds) when present, _blob_last_modified (ISO) as
+    fallback, NaT when neither parses.
+    """
+    pd = _load_pandas()
+    t = None
+    if "log_timestamp" in table.column_names:
+        num = pd.to_numeric(table.column("log_timestamp").to_pandas(), errors="coerce")
+        ms  = num.where(num > 1e12, num * 1000.0)
+        t   = pd.to_datetime(ms, unit="ms", utc=True, errors="coerce")
+    if "_blob_last_modified" in table.column_names:
+        fb = pd.to_datetime(table.column("_blob_last_modified").to_pandas(),
+                            utc=True, errors="coerce", format="ISO8601")
+        t = fb if t is None else t.fillna(fb)
+    return t
+
+def window_bounds(cfg: Dict[str, Any]) -> tuple[Optional[datetime], Optional[datetime]]:
     rng = (cfg.get("fetch_range") or "unlimited").lower()
     now = datetime.now(timezone.utc)
     start = end = None
@@ -305,25 +791,80 @@ def apply_window_and_limit_records(records: List[Dict[str, Any]], cfg: Dict[str,
     elif rng == "custom":
         start = parse_custom_utc(cfg.get("start_utc"))
         end   = parse_custom_utc(cfg.get("end_utc"))
+    return start, end
 
-    if start or end:
-        records = [r for r in records if record_in_window(r, start, end)]
+def apply_window_and_limit(table, cfg: Dict[str, Any], win_ts=None):
+    """Filter a projected table to the configured window with a vectorized mask.
+
+    win_ts is the timestamp series from the same _Derived generation as
+    `table`, so row counts always line up. Rows whose timestamp could not
+    be parsed are kept, matching the old per-record behavior. The legacy
+    max_blobs record cap still applies.
+    """
+    start, end = window_bounds(cfg)
+    if (start or end) and win_ts is not None:
+        pa = _load_pyarrow()
+        in_win = win_ts.notna()
+        if start:
+            in_win &= win_ts >= start
+        if end:
+            in_win &= win_ts <= end
+        keep = in_win | win_ts.isna()
+        table = table.filter(pa.array(keep.to_numpy()))
 
     max_blobs = 0
     try:
         max_blobs = int(cfg.get("max_blobs") or 0)
     except Exception:
         pass
-    if max_blobs > 0 and len(records) > max_blobs:
-        records = records[:max_blobs]
+    if max_blobs > 0 and table.num_rows > max_blobs:
+        table = table.slice(0, max_blobs)
 
-    return records
+    return table
 
 def humanize_utc(dt_utc: Optional[datetime]) -> str:
     if not dt_utc:
         return "-"
     return dt_utc.strftime("%b %d, %Y %H:%M:%S UTC")
 
+# ===========
+# ETag helpers
+# ===========
+def _data_etag(cfg: Dict[str, Any], d: _Derived) -> Optional[str]:
+    """Strong ETag for /data: cache generation plus the active window.
+
+    Relative windows (last_hour, ...) are quantized to the minute so
+    polling clients can still hit the 304 path between reloads.
+    """
+    if d.etag is None:
+        return None
+    start, end = window_bounds(cfg)
+    qs = start.replace(second=0, microsecond=0).isoformat() if start else ""
+    qe = end.replace(second=0, microsecond=0).isoformat() if end else ""
+    key = f"{d.etag}:{qs}:{qe}:{cfg.get('max_blobs')}"
+    return '"' + hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '"'
+
+def _not_modified(etag: Optional[str]) -> bool:
+    return bool(etag) and request.headers.get("If-None-Match") == etag
+
+def _with_etag(resp: Response, etag: Optional[str]) -> Response:
+    if etag:
+        resp.headers["ETag"] = etag
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def _windowed_records(cfg: Dict[str, Any], d: _Derived) -> tuple[List[Dict[str, Any]], List[str]]:
+    """Build the /data records for the configured window.
+
+    Applies the vectorized window mask and limit to the cached projection
+    (column count capped at 200, preferred columns first), then
+    materializes records with to_pylist() -- select() is zero-copy and
+    nulls come out as native None.
+    """
+    cols = d.cols[:200]  # cap
+    records = apply_window_and_limit(d.view.select(cols), cfg, d.win_ts).to_pylist()
+    return records, cols
+
 # =========
 # ROUTES
 # =========
@@ -359,12 +900,13 @@ def post_config():
         if k in payload and payload[k] is not None:
             current[k] = payload[k]
 
-    # max_blobs numeric
-    if "max_blobs" in payload:
-        try:
-            current["max_blobs"] = max(0, int(payload["max_blobs"]))
-        except Exception:
-            app.logger.warning("config POST: invalid max_blobs %r", payload.get("max_blobs"))
+    # max_blobs / cache_ttl_seconds numeric
+    for k in ("max_blobs", "cache_ttl_seconds"):
+        if k in payload:
+            try:
+                current[k] = max(0, int(payload[k]))
+            except Exception:
+                app.logger.warning("config POST: invalid %s %r", k, payload.get(k))
 
     # key: only overwrite if non-empty
     if payload.get("AZURE_STORAGE_KEY"):
@@ -372,11 +914,13 @@ def post_config():
 
     write_config(current)
 
-    # If credentials or container changed, you may want to clear the DF cache to force a reload
+    # If credentials or container changed, you may want to clear the table cache to force a reload
     # (kept simple: reload on next /data request)
-    global DF_CACHE, LAST_LOAD_UTC
-    DF_CACHE = None
+    global TABLE_CACHE, LAST_LOAD_UTC
+    TABLE_CACHE = None
     LAST_LOAD_UTC = None
+    _rebuild_derived_cache()
+    _drop_persisted_cache()
 
     return jsonify(current)
 
@@ -388,8 +932,10 @@ def post_config_default():
             def_cfg = json.loads(CFG_DEF.read_text(encoding="utf-8"))
             write_config({**DEFAULT_CONFIG, **def_cfg})
             # clear cache so next request reloads with defaults
-            global DF_CACHE, LAST_LOAD_UTC
-            DF_CACHE, LAST_LOAD_UTC = None, None
+            global TABLE_CACHE, LAST_LOAD_UTC
+            TABLE_CACHE, LAST_LOAD_UTC = None, None
+            _rebuild_derived_cache()
+            _drop_persisted_cache()
         except Exception:
             app.logger.exception("default restore failed")
     return jsonify(read_config())
@@ -440,52 +986,27 @@ def data():
             "last_load_human": "n/a",
             "error": "Unable to connect to Azure Blob Storage. Please check your configuration."
         }), 200
-        
-    ensure_loaded()
 
     cfg = read_config()
-    total = int(len(DF_CACHE)) if DF_CACHE is not None else 0
+    d = DERIVED  # one snapshot for the whole request
+    etag = _data_etag(cfg, d)
+    if _not_modified(etag):
+        return _with_etag(Response(status=304), etag)
+
     last_iso = LAST_LOAD_UTC.isoformat() if LAST_LOAD_UTC else "n/a"
     last_hmn = humanize_utc(LAST_LOAD_UTC)
 
-    if DF_CACHE is None or DF_CACHE.empty:
+    if d.view is None:
         payload = {
             "records": [],
             "columns": [],
-            "total": total,
+            "total": 0,
             "last_load_utc": last_iso,
             "last_load_human": last_hmn,
         }
         return jsonify(payload)
 
-    # preferred first, then the rest (legacy behavior)
-    import pandas as pd  # safe: we already checked in ensure_loaded()
-    preferred = [
-        "http_host", "status", "srccountry", "user_name", "http_agent",
-        "_blob_last_modified", "_blob_name"
-    ]
-    pref_present = [c for c in preferred if c in DF_CACHE.columns]
-    cols = pref_present + [c for c in DF_CACHE.columns if c not in pref_present]
-    cols = cols[:200]  # cap
-
-    dfj = DF_CACHE[cols].copy()
-    dfj = dfj.where(dfj.notnull(), None)
-
-    def _to_jsonable(x):
-        if isinstance(x, (pd.Timestamp, datetime)):
-            try:
-                return x.isoformat()
-            except Exception:
-                return str(x)
-        return x
-
-    for c in dfj.columns:
-        dfj[c] = dfj[c].map(_to_jsonable)
-
-    records = json.loads(dfj.to_json(orient="records"))
-
-    # Apply window & limit to what the UI receives
-    records = apply_window_and_limit_records(records, cfg)
+    records, cols = _windowed_records(cfg, d)
 
     payload = {
         "records": records,
@@ -498,77 +1019,93 @@ def data():
     if PY_DEBUG:
         app.logger.debug("[/data] rows=%d cols=%d", len(records), len(cols))
 
-    return jsonify(payload)
+    # Single serialization pass: records -> bytes, no jsonify round-trip.
+    return _with_etag(Response(orjson.dumps(payload), mimetype="application/json"), etag)
 
 # --- CSV download (server-side) ---
 @app.route("/data.csv")
 def data_csv():
     ensure_loaded()
-    if DF_CACHE is None or DF_CACHE.empty:
+    d = DERIVED
+    if d.csv_bytes is None:
         return Response("", mimetype="text/csv")
 
-    preferred = [
-        "http_host", "status", "srccountry", "user_name", "http_agent",
-        "_blob_last_modified", "_blob_name"
-    ]
-    pref_present = [c for c in preferred if c in DF_CACHE.columns]
-    cols = pref_present + [c for c in DF_CACHE.columns if c not in pref_present]
-    csv = DF_CACHE[cols].to_csv(index=False)
-    return Response(
-        csv,
+    etag = f'"{d.etag}"' if d.etag else None
+    if _not_modified(etag):
+        return _with_etag(Response(status=304), etag)
+
+    # Body is pre-serialized once per reload (pyarrow.csv.write_csv).
+    return _with_etag(Response(
+        d.csv_bytes,
         mimetype="text/csv",
         headers={"Content-Disposition": "attachment; filename=traffic_logs_current.csv"}
-    )
+    ), etag)
 
 # --- JSON download (server-side) ---
 @app.route("/data.json")
 def data_json():
     ensure_loaded()
-    if DF_CACHE is None or DF_CACHE.empty:
+    d = DERIVED
+    if d.json_bytes is None:
         return jsonify([])
 
-    import pandas as pd
-    preferred = [
-        "http_host", "status", "srccountry", "user_name", "http_agent",
-        "_blob_last_modified", "_blob_name"
-    ]
-    pref_present = [c for c in preferred if c in DF_CACHE.columns]
-    cols = pref_present + [c for c in DF_CACHE.columns if c not in pref_present]
+    etag = f'"{d.etag}"' if d.etag else None
+    if _not_modified(etag):
+        return _with_etag(Response(status=304), etag)
 
-    dfj = DF_CACHE[cols].copy()
-    dfj = dfj.where(dfj.notnull(), None)
-
-    def _to_jsonable(x):
-        if isinstance(x, (pd.Timestamp, datetime)):
-            try:
-                return x.isoformat()
-            except Exception:
-                return str(x)
-        return x
-
-    for c in dfj.columns:
-        dfj[c] = dfj[c].map(_to_jsonable)
-
-    payload = json.loads(dfj.to_json(orient="records"))
-    return jsonify(payload)
+    # Body is pre-serialized once per reload; no per-request serialization.
+    return _with_etag(Response(d.json_bytes, mimetype="application/json"), etag)
 
 # --- Reload from Azure (rebuild cache) ---
 @app.route("/reload", methods=["POST"])
 def reload_data():
     app.logger.info("Reload requested")
-    global DF_CACHE, LAST_LOAD_UTC
+    global TABLE_CACHE, LAST_LOAD_UTC
     cfg = read_config()
-    DF_CACHE = load_logs_from_blob(cfg)
-    LAST_LOAD_UTC = datetime.now(timezone.utc)
-    app.logger.info("Reload complete: rows=%d", 0 if DF_CACHE is None else len(DF_CACHE))
-    return jsonify({"ok": True, "rows": int(len(DF_CACHE)), "last_load_utc": LAST_LOAD_UTC.isoformat()})
+    with LOAD_LOCK:
+        seen = _cache_blob_watermarks()
+        if TABLE_CACHE is not None and seen:
+            # Incremental: only fetch blobs that are new or modified.
+            delta = load_logs_from_blob(cfg, seen=seen)
+            if delta.num_rows:
+                pa = _load_pyarrow()
+                pc = pa.compute
+                try:
+                    # A modified blob is refetched in full, so drop its
+                    # cached rows first: appended-to blobs are replaced,
+                    # not duplicated.
+                    refetched = pc.unique(delta.column("_blob_name").cast(pa.string()))
+                    keep = pc.invert(pc.is_in(
+                        TABLE_CACHE.column("_blob_name").cast(pa.string()),
+                        value_set=refetched))
+                    base = TABLE_CACHE.filter(keep)
+                    merged = _concat_tables_safe(pa, [base, delta] if base.num_rows else [delta])
+                    if "_sort_ts" in merged.column_names:
+                        merged = merged.sort_by([("_sort_ts", "ascending")])
+                    TABLE_CACHE = merged
+                except Exception:
+                    # Delta schema irreconcilable with the cached table
+                    # (types inferred per load can disagree across reloads);
+                    # rebuild from scratch rather than failing /reload.
+                    app.logger.exception("incremental merge failed; falling back to full reload")
+                    TABLE_CACHE = load_logs_from_blob(cfg)
+        else:
+            TABLE_CACHE = load_logs_from_blob(cfg)
+        LAST_LOAD_UTC = datetime.now(timezone.utc)
+        _rebuild_derived_cache()
+        _persist_cache(cfg)
+    app.logger.info("Reload complete: rows=%d", 0 if TABLE_CACHE is None else TABLE_CACHE.num_rows)
+    return jsonify({"ok": True, "rows": int(TABLE_CACHE.num_rows), "last_load_utc": LAST_LOAD_UTC.isoformat()})
 
 # Serve /favicon.ico -> /static/favicon.ico
 @app.route("/favicon.ico")
 def favicon():
     return send_from_directory(app.static_folder, "favicon.ico")
 
-# --- Main ---
+# --- Main (dev only) ---
+# Production runs under gunicorn with one worker and a gthread pool so the
+# in-memory cache is shared and requests stay concurrent during Azure waits:
+#   gunicorn -w 1 --threads 8 -k gthread -b 0.0.0.0:8000 app:app
 if __name__ == "__main__":
     cfg = read_config()
     port = int(cfg.get("PORT") or os.getenv("PORT", "8000"))
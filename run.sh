@@ -83,4 +83,7 @@ rm -f config.json.bak-* || true
 rm -f *.json.bak-* || true
 
 # ---------- Start app ----------
-exec python app.py
+# One worker so the in-memory blob cache is shared; gthread pool so requests
+# stay concurrent while Azure downloads block on I/O.
+PORT="${PORT:-$(grep -E '^PORT=' .env 2>/dev/null | cut -d= -f2)}"
+exec gunicorn -w 1 --threads 8 -k gthread -b "0.0.0.0:${PORT:-8000}" app:app